@@ -0,0 +1,94 @@
+"""Startup-time benchmark for the backend.
+
+Each run starts a fresh interpreter (in a temporary directory, so the real
+tripplanner.db is untouched) and measures how long `import main` and the app
+lifespan startup take. The first run sees an empty database (schema creation),
+later runs reuse it like a normal worker restart.
+
+Usage (from backend/):
+    python bench_startup.py [--runs 5] [--output startup_bench.jsonl] [--max-import-ms 1500]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def run():
+    async with main.lifespan(main.app):
+        started = time.perf_counter()
+    return started
+
+t2 = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "lifespan_ms": (t2 - t1) * 1000,
+    "reportlab_loaded": "reportlab" in sys.modules,
+    "httpx_loaded": "httpx" in sys.modules,
+}))
+"""
+
+
+def run_once(workdir: str, env: dict) -> dict:
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="warm runs after the first (empty DB) run")
+    parser.add_argument("--output", help="append the summary as a JSON line to this file")
+    parser.add_argument("--max-import-ms", type=float, help="exit with status 1 if median import time exceeds this")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    env.pop("TRIPPLANNER_PREWARM", None)
+    env.pop("SQL_ECHO", None)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        first = run_once(workdir, env)
+        warm = [run_once(workdir, env) for _ in range(args.runs)]
+
+    summary = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "first_run": {k: round(v, 1) if isinstance(v, float) else v for k, v in first.items()},
+        "median_import_ms": round(statistics.median(r["import_ms"] for r in warm), 1),
+        "median_lifespan_ms": round(statistics.median(r["lifespan_ms"] for r in warm), 1),
+        "median_process_ms": round(statistics.median(r["process_ms"] for r in warm), 1),
+        "reportlab_loaded": any(r["reportlab_loaded"] for r in warm),
+        "httpx_loaded": any(r["httpx_loaded"] for r in warm),
+    }
+    print(json.dumps(summary, indent=2))
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+
+    if args.max_import_ms is not None and summary["median_import_ms"] > args.max_import_ms:
+        print(f"Median import time {summary['median_import_ms']}ms exceeds {args.max_import_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,12 @@
+import os
 from databases import Database
 from sqlalchemy import MetaData
 from sqlalchemy.ext.asyncio import create_async_engine
 
 DATABASE_URL = "sqlite+aiosqlite:///./tripplanner.db"
 
-# Asynchronní engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Asynchronní engine (SQL logování jen při SQL_ECHO=1, zpomaluje start)
+engine = create_async_engine(DATABASE_URL, echo=os.getenv("SQL_ECHO", "").lower() in ("1", "true", "yes"))
 
 # Metadata pro tabulky
 metadata = MetaData()
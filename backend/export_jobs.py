@@ -0,0 +1,377 @@
+"""Background PDF export jobs backed by SQLite and a bounded local worker pool.
+
+Jobs live in the shared export_jobs table so several app processes (uvicorn
+workers, replicas) can serve them. A process claims a job atomically
+(queued -> running with its owner id) and keeps a heartbeat while working on
+it; running jobs whose heartbeat goes stale are handed back to the queue.
+PDFs are rendered in a separate process pool so ReportLab's CPU-bound layout
+never competes with the event loop for the GIL.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from db import database, engine
+from models import trips, export_jobs
+
+EXPORT_DIR = Path(__file__).resolve().parent / "exports"
+EXPORT_WORKERS = 2             # max trips rendered concurrently (render processes)
+MAX_EXPORT_TRIPS = 50          # max trips per job
+EXPORT_TTL = 24 * 60 * 60      # finished jobs (and their files) kept for 24h
+EXPORT_HEARTBEAT = 30          # running jobs refresh heartbeat_at this often (s)
+EXPORT_LEASE = 120             # running jobs without a heartbeat for this long are requeued (s)
+EXPORT_SWEEP_INTERVAL = 60     # how often expired jobs are pruned and stale ones requeued (s)
+
+# Unique per process; stored in export_jobs.owner for jobs this process is running
+OWNER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+PlacesFetcher = Callable[[str, str], Awaitable[list[dict]]]  # (city, lang) -> places
+
+_queue: asyncio.Queue | None = None
+_queued_ids: set[str] = set()
+_workers: list[asyncio.Task] = []
+_pool: ProcessPoolExecutor | None = None
+_fetch_places: PlacesFetcher | None = None
+# Background jobs fetch place details one trip at a time to limit load on the event loop
+_fetch_slot = asyncio.Semaphore(1)
+
+
+def trip_pdf_filename(trip_data: dict) -> str:
+    """Descriptive download filename for a trip PDF."""
+    city = (trip_data.get("city") or f"Trip{trip_data.get('id')}").replace(" ", "_")
+    days = trip_data.get("days", "")
+    return f"TripPlanner_{city}_{days}days.pdf"
+
+
+async def load_trip_export_data(trip_id: int, fetch_places: PlacesFetcher, lang: str = "en") -> tuple[dict, list[dict]] | None:
+    """Fetch a trip and the details (with images) of its saved places.
+
+    Args:
+        trip_id: Trip to load
+        fetch_places: Coroutine returning the enriched places for (city, lang)
+        lang: Language for translated place names
+
+    Returns:
+        (trip_data, place_details) or None if the trip does not exist
+    """
+    row = await database.fetch_one(trips.select().where(trips.c.id == trip_id))
+    if not row:
+        return None
+
+    trip_data = dict(row)
+
+    # Parse places_to_visit (xids)
+    place_xids = []
+    try:
+        if trip_data.get("places_to_visit"):
+            place_xids = json.loads(trip_data["places_to_visit"]) or []
+    except Exception:
+        place_xids = []
+
+    # Fetch detailed place info with images
+    place_details = []
+    if place_xids and trip_data.get("city"):
+        try:
+            places_data = await fetch_places(trip_data["city"], lang)
+            # Filter to only saved xids (normalize to strings for comparison)
+            xid_set = set(str(xid) for xid in place_xids)
+            place_details = [p for p in places_data if str(p.get("xid")) in xid_set]
+            # Sort by original order
+            xid_order = {str(xid): i for i, xid in enumerate(place_xids)}
+            place_details.sort(key=lambda p: xid_order.get(str(p.get("xid")), 999))
+        except Exception:
+            pass  # Fallback to xids only if fetch fails
+
+    return trip_data, place_details
+
+
+def _render_pdf_to_file(trip_data: dict, place_details: list[dict], out_path: str) -> None:
+    """Render a trip PDF to out_path. Runs in the render process pool."""
+    from pdf_generator import generate_trip_pdf  # ReportLab is loaded in the render process only
+
+    buffer = asyncio.run(generate_trip_pdf(trip_data, place_details))
+    Path(out_path).write_bytes(buffer.getvalue())
+
+
+def _warm_render_process() -> None:
+    import pdf_generator  # noqa: F401
+
+
+def _new_pool() -> ProcessPoolExecutor:
+    # Processes are spawned on first submit, so this doesn't slow down startup
+    return ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _remove_paths(paths: list[Path]) -> None:
+    """Delete files/directories (runs on a worker thread, a parts dir can hold many PDFs)."""
+    for p in paths:
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+
+
+def _prune_export_dir(cutoff: float) -> None:
+    """Delete anything in EXPORT_DIR older than cutoff (runs on a worker thread).
+
+    Finished jobs expire together with their files, so this only catches leftovers
+    from processes that died mid-job or lost their lease.
+    """
+    if EXPORT_DIR.is_dir():
+        _remove_paths([p for p in EXPORT_DIR.iterdir() if p.stat().st_mtime < cutoff])
+
+
+def _write_zip(path: Path, entries: list[tuple[str, Path]]) -> None:
+    """Build the whole archive in one go (runs on a worker thread)."""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, part in entries:
+            zf.write(part, arcname=name)
+
+
+async def _claim_job(job_id: str) -> bool:
+    """Atomically move a queued job to running under this process. False if someone else got it."""
+    now = time.time()
+    async with engine.begin() as conn:
+        res = await conn.execute(
+            export_jobs.update()
+            .where(export_jobs.c.id == job_id, export_jobs.c.status == "queued")
+            .values(status="running", owner=OWNER_ID, heartbeat_at=now, updated_at=now, completed=0, error=None)
+        )
+    return res.rowcount == 1
+
+
+async def _update_job(job_id: str, **values) -> bool:
+    """Update a job this process owns. False if the job was requeued/taken over meanwhile."""
+    now = time.time()
+    values["updated_at"] = now
+    values["heartbeat_at"] = now
+    async with engine.begin() as conn:
+        res = await conn.execute(
+            export_jobs.update()
+            .where(export_jobs.c.id == job_id, export_jobs.c.owner == OWNER_ID, export_jobs.c.status == "running")
+            .values(**values)
+        )
+    return res.rowcount == 1
+
+
+class _LostJob(Exception):
+    """The job's lease expired and it was handed to another worker."""
+
+
+async def _heartbeat(job_id: str) -> None:
+    while True:
+        await asyncio.sleep(EXPORT_HEARTBEAT)
+        try:
+            await _update_job(job_id)
+        except Exception:
+            pass  # Retry on the next beat; the lease tolerates a few misses
+
+
+async def _render_trip(trip_id: int, lang: str, out_path: Path) -> dict:
+    global _pool
+    async with _fetch_slot:
+        data = await load_trip_export_data(trip_id, _fetch_places, lang)
+    if data is None:
+        raise LookupError(f"Trip {trip_id} not found")
+    trip_data, place_details = data
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = _pool
+        try:
+            await loop.run_in_executor(pool, _render_pdf_to_file, trip_data, place_details, str(out_path))
+            return trip_data
+        except BrokenProcessPool:
+            # A render process died (e.g. OOM-killed); the executor is unusable from now on,
+            # so replace it (unless another worker already did) and retry once
+            if _pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                _pool = _new_pool()
+    raise RuntimeError(f"Render process crashed twice while exporting trip {trip_id}")
+
+
+async def _run_job(job_id: str) -> None:
+    if not await _claim_job(job_id):
+        return
+    job = await database.fetch_one(export_jobs.select().where(export_jobs.c.id == job_id))
+
+    trip_ids = json.loads(job["trip_ids"])
+    lang = job["lang"] or "en"
+    # All files are per owner, so a worker that lost its lease can't clobber the new owner's output
+    path = EXPORT_DIR / f"{job_id}.{OWNER_ID}.{job['format']}"
+    tmp_path = EXPORT_DIR / f"{job_id}.{OWNER_ID}.tmp"
+    parts_dir = EXPORT_DIR / f"{job_id}.{OWNER_ID}.parts"
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+
+    try:
+        EXPORT_DIR.mkdir(exist_ok=True)
+        if job["format"] == "pdf":
+            trip_data = await _render_trip(trip_ids[0], lang, tmp_path)
+            filename = trip_pdf_filename(trip_data)
+        else:
+            filename = f"TripPlanner_export_{len(trip_ids)}trips.zip"
+            parts_dir.mkdir(exist_ok=True)
+            entries: list[tuple[str, Path]] = []
+            used_names: set[str] = set()
+            for i, trip_id in enumerate(trip_ids, 1):
+                part = parts_dir / f"{trip_id}.pdf"
+                trip_data = await _render_trip(trip_id, lang, part)
+                name = trip_pdf_filename(trip_data)
+                if name in used_names:
+                    name = name[:-len(".pdf")] + f"_{trip_id}.pdf"
+                used_names.add(name)
+                entries.append((name, part))
+                if not await _update_job(job_id, completed=i):
+                    raise _LostJob()
+            await asyncio.to_thread(_write_zip, tmp_path, entries)
+        # Confirm we still own the job before publishing the file
+        if not await _update_job(job_id, completed=len(trip_ids)):
+            raise _LostJob()
+        os.replace(tmp_path, path)
+        if not await _update_job(job_id, status="done", file_path=str(path), filename=filename):
+            raise _LostJob()
+    except _LostJob:
+        await asyncio.to_thread(_remove_paths, [path])
+    except Exception as e:
+        await _update_job(job_id, status="failed", error=str(e))
+    finally:
+        heartbeat.cancel()
+        await asyncio.to_thread(_remove_paths, [tmp_path, parts_dir])
+
+
+def _enqueue(job_id: str) -> None:
+    if job_id not in _queued_ids:
+        _queued_ids.add(job_id)
+        _queue.put_nowait(job_id)
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        _queued_ids.discard(job_id)
+        try:
+            await _run_job(job_id)
+        except Exception:
+            pass  # Job state update failed; keep the worker alive
+        finally:
+            _queue.task_done()
+
+
+async def _prune_expired_jobs() -> None:
+    cutoff = time.time() - EXPORT_TTL
+    rows = await database.fetch_all(
+        export_jobs.select().where(
+            export_jobs.c.status.in_(("done", "failed")),
+            export_jobs.c.updated_at < cutoff,
+        )
+    )
+    await asyncio.to_thread(_remove_paths, [Path(r["file_path"]) for r in rows if r["file_path"]])
+    if rows:
+        await database.execute(export_jobs.delete().where(export_jobs.c.id.in_([r["id"] for r in rows])))
+    await asyncio.to_thread(_prune_export_dir, cutoff)
+
+
+async def _requeue_pending_jobs() -> None:
+    """Hand back running jobs with a stale heartbeat and pick up queued jobs from any process."""
+    now = time.time()
+    await database.execute(
+        export_jobs.update()
+        .where(export_jobs.c.status == "running", export_jobs.c.heartbeat_at < now - EXPORT_LEASE)
+        .values(status="queued", owner=None, updated_at=now)
+    )
+    pending = await database.fetch_all(
+        export_jobs.select()
+        .where(export_jobs.c.status == "queued")
+        .order_by(export_jobs.c.created_at)
+    )
+    for r in pending:
+        _enqueue(r["id"])
+
+
+async def _sweeper() -> None:
+    while True:
+        try:
+            await _prune_expired_jobs()
+            await _requeue_pending_jobs()
+        except Exception:
+            pass  # Try again on the next sweep
+        await asyncio.sleep(EXPORT_SWEEP_INTERVAL)
+
+
+async def start_export_workers(fetch_places: PlacesFetcher) -> None:
+    """Start the worker pool and the sweeper that prunes expired jobs and requeues stale ones.
+
+    Args:
+        fetch_places: Coroutine returning the enriched places for (city, lang), called in-process
+    """
+    global _queue, _pool, _fetch_places
+    _queue = asyncio.Queue()
+    _queued_ids.clear()
+    _fetch_places = fetch_places
+    _pool = _new_pool()
+    _workers.append(asyncio.create_task(_sweeper()))
+    for _ in range(EXPORT_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_export_workers() -> None:
+    """Cancel workers and hand this process's running jobs back to the queue."""
+    global _pool
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await database.execute(
+        export_jobs.update()
+        .where(export_jobs.c.status == "running", export_jobs.c.owner == OWNER_ID)
+        .values(status="queued", owner=None, updated_at=time.time())
+    )
+    if _pool:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def warm_render_pool() -> None:
+    """Spawn the render processes and load ReportLab in them ahead of the first export."""
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(loop.run_in_executor(_pool, _warm_render_process) for _ in range(EXPORT_WORKERS)),
+        return_exceptions=True,
+    )
+
+
+async def create_export_job(trip_ids: list[int], fmt: str, lang: str) -> str:
+    """Persist a new job and hand it to the worker pool. Returns the job id."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    await database.execute(export_jobs.insert().values(
+        id=job_id,
+        status="queued",
+        trip_ids=json.dumps(trip_ids),
+        format=fmt,
+        lang=lang,
+        total=len(trip_ids),
+        completed=0,
+        error=None,
+        file_path=None,
+        filename=None,
+        owner=None,
+        heartbeat_at=None,
+        created_at=now,
+        updated_at=now,
+    ))
+    _enqueue(job_id)
+    return job_id
+
+
+async def get_export_job(job_id: str) -> dict | None:
+    row = await database.fetch_one(export_jobs.select().where(export_jobs.c.id == job_id))
+    return dict(row) if row else None
@@ -1,7 +1,12 @@
 """Image enrichment for places using Wikipedia and Wikidata APIs."""
-import httpx
+from __future__ import annotations
+
 import time
 import urllib.parse
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import httpx
 
 # In-memory cache for images
 IMG_CACHE: dict[str, tuple[float, str]] = {}  # key -> (timestamp, image_url)
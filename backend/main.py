@@ -1,15 +1,28 @@
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from db import database, engine, metadata
-from models import trips
-from pdf_generator import generate_trip_pdf
+from models import trips, SCHEMA_VERSION
+from export_jobs import (
+    MAX_EXPORT_TRIPS,
+    create_export_job,
+    get_export_job,
+    load_trip_export_data,
+    start_export_workers,
+    stop_export_workers,
+    trip_pdf_filename,
+    warm_render_pool,
+)
 from image_enrichment import enrich_places_with_images, normalize_image_url
 from contextlib import asynccontextmanager
+from typing import Literal
+import asyncio
+import importlib
 import math
+import os
+import sys
 import urllib.parse
-import httpx
 import time
 import re
 import unicodedata
@@ -23,6 +36,10 @@ PLACES_CACHE: dict[tuple[str, str, int], tuple[float, list]] = {}  # (city_lower
 GEO_TTL = 24 * 60 * 60  # 24h
 PLACES_TTL = 10 * 60    # 10m
 
+# Set TRIPPLANNER_PREWARM=1 to load lazily-imported modules (httpx, ReportLab) and spawn the
+# export render processes in the background right after startup instead of on first use
+PREWARM = os.getenv("TRIPPLANNER_PREWARM", "").lower() in ("1", "true", "yes")
+
 def normalize_name(n: str) -> str:
     n = (n or "").strip()
     n = unicodedata.normalize("NFKD", n)
@@ -41,24 +58,62 @@ class TripIn(BaseModel):
 class PlacesIn(BaseModel):
     places: list[str]
 
+class ExportIn(BaseModel):
+    trip_ids: list[int]
+    # None: single PDF for one trip, ZIP for several
+    format: Literal["pdf", "zip"] | None = None
+    lang: str = "en"
+
 async def init_db():
     async with engine.begin() as conn:
+        # Skip create_all and the migration check when the schema is already current
+        # (or was stamped by newer code, e.g. after a rollback)
+        res = await conn.exec_driver_sql("PRAGMA user_version;")
+        if res.scalar() >= SCHEMA_VERSION:
+            return
         await conn.run_sync(metadata.create_all)
-        # Best-effort SQLite migration to add places_to_visit column if missing
+        # Best-effort SQLite migration to add columns introduced after a table was created
         try:
-            res = await conn.exec_driver_sql("PRAGMA table_info(trips);")
-            cols = [row[1] for row in res.fetchall()]
-            if "places_to_visit" not in cols:
-                await conn.exec_driver_sql("ALTER TABLE trips ADD COLUMN places_to_visit TEXT;")
+            for table, column, col_type in (
+                ("trips", "places_to_visit", "TEXT"),
+                ("export_jobs", "owner", "VARCHAR"),
+                ("export_jobs", "heartbeat_at", "FLOAT"),
+            ):
+                res = await conn.exec_driver_sql(f"PRAGMA table_info({table});")
+                cols = [row[1] for row in res.fetchall()]
+                if column not in cols:
+                    await conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {col_type};")
         except Exception:
-            # Ignore migration errors so the app can still start
-            pass
+            # Ignore migration errors so the app can still start; the version stays
+            # unstamped so the migration is retried on the next start
+            return
+        await conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+async def lazy_import(name: str):
+    """Import a heavy module on first use without stalling the event loop."""
+    module = sys.modules.get(name)
+    # A module being imported by another thread is already in sys.modules, but incomplete
+    if module is None or getattr(getattr(module, "__spec__", None), "_initializing", False):
+        module = await asyncio.to_thread(importlib.import_module, name)
+    return module
+
+async def prewarm():
+    """Load the modules that are otherwise imported on first use and start the render processes."""
+    await lazy_import("httpx")
+    await lazy_import("pdf_generator")
+    await warm_render_pool()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
     await database.connect()
+    await start_export_workers(fetch_export_places)
+    # Keep a reference so the task is not garbage-collected
+    prewarm_task = asyncio.create_task(prewarm()) if PREWARM else None
     yield
+    if prewarm_task:
+        await asyncio.gather(prewarm_task, return_exceptions=True)
+    await stop_export_workers()
     await database.disconnect()
 
 app = FastAPI(lifespan=lifespan)
@@ -107,58 +162,81 @@ async def delete_trip(trip_id: int):
 
 @app.get("/trips/{trip_id}/export/pdf")
 async def export_trip_pdf(trip_id: int):
-    # Fetch trip
-    row = await database.fetch_one(trips.select().where(trips.c.id == trip_id))
-    if not row:
+    data = await load_trip_export_data(trip_id, fetch_export_places)
+    if data is None:
         raise HTTPException(status_code=404, detail="Trip not found")
-    
-    trip_data = dict(row)
-    
-    # Parse places_to_visit (xids)
-    place_xids = []
-    try:
-        if trip_data.get("places_to_visit"):
-            place_xids = json.loads(trip_data["places_to_visit"]) or []
-    except Exception:
-        place_xids = []
-    
-    # Fetch detailed place info with images
-    place_details = []
-    if place_xids and trip_data.get("city"):
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.get(
-                    f"http://127.0.0.1:8000/places/{trip_data['city']}",
-                    params={"with_images": "true", "limit": 100}
-                )
-                if resp.status_code == 200:
-                    places_data = resp.json().get("places", [])
-                    # Filter to only saved xids (normalize to strings for comparison)
-                    xid_set = set(str(xid) for xid in place_xids)
-                    place_details = [p for p in places_data if str(p.get("xid")) in xid_set]
-                    # Sort by original order
-                    xid_order = {str(xid): i for i, xid in enumerate(place_xids)}
-                    place_details.sort(key=lambda p: xid_order.get(str(p.get("xid")), 999))
-        except Exception:
-            pass  # Fallback to xids only if fetch fails
+    trip_data, place_details = data
 
-    # Generate PDF using pdf_generator module
+    # Generate PDF using pdf_generator module (ReportLab is imported on first use)
+    pdf_generator = await lazy_import("pdf_generator")
     try:
-        buffer = await generate_trip_pdf(trip_data, place_details)
+        buffer = await pdf_generator.generate_trip_pdf(trip_data, place_details)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {e}")
 
-    # Generate descriptive filename
-    city = (trip_data.get("city") or f"Trip{trip_id}").replace(" ", "_")
-    days = trip_data.get("days", "")
-    filename = f"TripPlanner_{city}_{days}days.pdf"
-    
     headers = {
-        "Content-Disposition": f"attachment; filename={filename}"
+        "Content-Disposition": f"attachment; filename={trip_pdf_filename(trip_data)}"
     }
     return StreamingResponse(buffer, media_type="application/pdf", headers=headers)
 
 
+async def fetch_export_places(city: str, lang: str) -> list[dict]:
+    """Places with images for PDF exports, using the /places logic in-process (no loopback HTTP)."""
+    res = await places_for_city(city, limit=100, with_images=True, lang=lang)
+    return res["places"]
+
+
+@app.post("/exports", status_code=202)
+async def create_export(payload: ExportIn):
+    """Queue a background export of one or more trips (PDF or ZIP of PDFs)."""
+    trip_ids = list(dict.fromkeys(payload.trip_ids))
+    if not trip_ids:
+        raise HTTPException(status_code=422, detail="No trip ids given")
+    if len(trip_ids) > MAX_EXPORT_TRIPS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_EXPORT_TRIPS} trips per export")
+    fmt = payload.format or ("pdf" if len(trip_ids) == 1 else "zip")
+    if fmt == "pdf" and len(trip_ids) > 1:
+        raise HTTPException(status_code=422, detail="Format 'pdf' supports a single trip; use 'zip'")
+
+    rows = await database.fetch_all(trips.select().where(trips.c.id.in_(trip_ids)))
+    missing = sorted(set(trip_ids) - {r["id"] for r in rows})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Trips not found: {missing}")
+
+    job_id = await create_export_job(trip_ids, fmt, payload.lang)
+    return {"id": job_id, "status": "queued", "total": len(trip_ids), "completed": 0}
+
+
+@app.get("/exports/{job_id}")
+async def export_status(job_id: str):
+    job = await get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "format": job["format"],
+        "tripIds": json.loads(job["trip_ids"]),
+        "total": job["total"],
+        "completed": job["completed"],
+        "error": job["error"],
+        "downloadUrl": f"/exports/{job_id}/download" if job["status"] == "done" else None,
+    }
+
+
+@app.get("/exports/{job_id}/download")
+async def export_download(job_id: str):
+    job = await get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if not os.path.isfile(job["file_path"] or ""):
+        raise HTTPException(status_code=410, detail="Export file expired")
+    media_type = "application/pdf" if job["format"] == "pdf" else "application/zip"
+    return FileResponse(job["file_path"], media_type=media_type, filename=job["filename"])
+
+
 @app.patch("/trips/{trip_id}/places")
 async def update_places(trip_id: int, payload: PlacesIn):
     # store as JSON text in places_to_visit
@@ -174,6 +252,7 @@ NAME_TTL = 24 * 60 * 60
 @app.get("/places/{city}")
 async def places_for_city(city: str, radius: int = 5000, limit: int = 10, category: str = "all", with_images: bool = False, lang: str = "en"):
     """Return interesting places with optional English translation and image enrichment."""
+    httpx = await lazy_import("httpx")
     now = time.time()
     async with httpx.AsyncClient(timeout=30.0) as client:
         cached_geo = GEOCODE_CACHE.get(city.lower())
@@ -396,4 +475,4 @@ async def places_for_city(city: str, radius: int = 5000, limit: int = 10, catego
         if with_images:
             await enrich_places_with_images(dedup, client)
 
-    return {"city": city, "lon": lon, "lat": lat, "places": dedup, "lang": lang}
\ No newline at end of file
+    return {"city": city, "lon": lon, "lat": lat, "places": dedup, "lang": lang}
@@ -1,6 +1,10 @@
-from sqlalchemy import Table, Column, Integer, String, JSON
+from sqlalchemy import Table, Column, Integer, String, Float, JSON
 from db import metadata
 
+# Bump whenever tables or columns change so init_db re-runs create_all and migrations
+# (stored in SQLite's PRAGMA user_version)
+SCHEMA_VERSION = 3
+
 trips = Table(
     "trips",
     metadata,
@@ -10,4 +14,28 @@ trips = Table(
     Column("description", String),
     # JSON-encoded array of POI xids (stored as TEXT for SQLite compatibility)
     Column("places_to_visit", String, nullable=True),
-)
\ No newline at end of file
+)
+
+export_jobs = Table(
+    "export_jobs",
+    metadata,
+    Column("id", String, primary_key=True),
+    # queued -> running -> done | failed
+    Column("status", String),
+    # JSON-encoded array of trip ids to render
+    Column("trip_ids", String),
+    # "pdf" (single trip) or "zip" (one PDF per trip)
+    Column("format", String),
+    Column("lang", String),
+    Column("total", Integer),
+    Column("completed", Integer),
+    Column("error", String, nullable=True),
+    Column("file_path", String, nullable=True),
+    # Download filename offered to the client once the job is done
+    Column("filename", String, nullable=True),
+    # Process currently running the job and its last sign of life (see export_jobs.py)
+    Column("owner", String, nullable=True),
+    Column("heartbeat_at", Float, nullable=True),
+    Column("created_at", Float),
+    Column("updated_at", Float),
+)